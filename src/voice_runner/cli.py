@@ -1,10 +1,9 @@
 # ----------------------- CLI / Main -----------------------
 import argparse
 import shlex
-from typing import Dict
 
-from runner import (CONFIG_PATH, handle_list, handle_map, handle_run,
-                    handle_unmap, load_config)
+from runner import (CONFIG_PATH, AliasIndex, handle_list, handle_map,
+                    handle_run, handle_unmap, load_index)
 from voice import list_audio_devices, start_voice_listener
 
 
@@ -26,7 +25,7 @@ def print_help() -> None:
     """))
 
 
-def repl(aliases: Dict[str, str]) -> None:
+def repl(index: AliasIndex) -> None:
     print("Phrase→Script Runner (type 'help' for commands)")
     print(f"Config file: {CONFIG_PATH}")
     while True:
@@ -39,10 +38,14 @@ def repl(aliases: Dict[str, str]) -> None:
         if not raw:
             continue
 
-        try:
-            parts = shlex.split(raw)
-        except ValueError:
+        if '"' not in raw and "'" not in raw and "\\" not in raw:
+            # nothing for shlex to unquote
             parts = raw.split()
+        else:
+            try:
+                parts = shlex.split(raw)
+            except ValueError:
+                parts = raw.split()
 
         cmd = parts[0].lower()
 
@@ -52,17 +55,17 @@ def repl(aliases: Dict[str, str]) -> None:
         elif cmd == "help":
             print_help()
         elif cmd == "map":
-            handle_map(parts[1:], aliases)
+            handle_map(parts[1:], index)
         elif cmd == "unmap":
-            handle_unmap(parts[1:], aliases)
+            handle_unmap(parts[1:], index)
         elif cmd == "list":
-            handle_list(aliases)
+            handle_list(index)
         elif cmd == "run" or raw.lower().startswith("run "):
             rest = raw[len("run "):] if cmd == "run" else raw
-            handle_run(rest, aliases)
+            handle_run(rest, index)
         else:
             if raw.lower().startswith("run "):
-                handle_run(raw, aliases)
+                handle_run(raw, index)
             else:
                 print(f"[??] Unknown command: {cmd!r} — try 'help'")
 
@@ -99,19 +102,19 @@ def main():
         list_audio_devices()
         return
 
-    aliases = load_config()
+    index = load_index()
 
-    voice_thread = None
+    voice_proc = None
     if args.voice:
-        voice_thread = start_voice_listener(
-            aliases, args.model, args.device
+        voice_proc = start_voice_listener(
+            index, args.model, args.device
         )
 
     # Start the REPL regardless;
     # you can interact while voice listens in the background
-    repl(aliases)
+    repl(index)
 
-    # On exit, the voice thread (daemon) will stop with the process.
+    # On exit, the voice subprocess (daemon) is terminated with the process.
 
 
 if __name__ == "__main__":
@@ -1,22 +1,94 @@
 # Script launching and utils
+import bisect
+import codecs
+import io
 import json
+import locale
 import os
 import re
+import selectors
+import shutil
 import signal
 import sys
-import threading
+import tempfile
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from subprocess import PIPE, STDOUT, Popen
-from typing import Dict, List, Optional, Tuple
+from subprocess import PIPE, STDOUT, Popen, TimeoutExpired
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # stdlib json is used instead
+    orjson = None
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # fall back to the pure-Python overlap scorer
+    fuzz = process = None
 
 CONFIG_PATH = Path(os.path.expanduser("~")) / ".script_aliases.json"
 
+# filler words dropped before matching ("run the scrape program")
+_STOP = frozenset({"the", "a", "an", "program", "script", "app"})
+
+_RUN_RE = re.compile(r"^run\s+(.*)$", re.I)
+
+# rapidfuzz token_set_ratio (0-100) an alias sharing a token with the
+# phrase needs to stay in the running; when nothing shares a token or a
+# substring, only near-exact spellings of a whole alias count
+# ("scrpae data" → "scrape data", but not "test" → "best")
+MATCH_CUTOFF = 60
+NO_SHARED_CUTOFF = 90
+
+# (st_ino, st_size, st_mtime_ns) of the config file. mtime alone can
+# repeat on coarse-timestamp filesystems; save_config renames a fresh
+# file into place, so consecutive saves also differ in inode.
+ConfigGeneration = Tuple[int, int, int]
+
+# (path, generation, aliases) of the last config read or written
+_CFG_CACHE: Optional[Tuple[Path, ConfigGeneration, Dict[str, str]]] = None
+
+
+def clear_config_cache() -> None:
+    global _CFG_CACHE
+    _CFG_CACHE = None
+
+
+def _generation(path: Path) -> ConfigGeneration:
+    st = path.stat()
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def config_generation() -> Optional[ConfigGeneration]:
+    """
+    Generation of CONFIG_PATH as this process last read or wrote it,
+    or None if it hasn't yet.
+    """
+    cached = _CFG_CACHE
+    if cached is None or cached[0] != CONFIG_PATH:
+        return None
+    return cached[1]
+
 
 def load_config() -> Dict[str, str]:
+    global _CFG_CACHE
     if CONFIG_PATH.exists():
         try:
-            data = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
-            return {str(k): str(v) for k, v in data.items()}
+            gen = _generation(CONFIG_PATH)
+            cached = _CFG_CACHE
+            if cached is not None and cached[:2] == (CONFIG_PATH, gen):
+                return dict(cached[2])
+            raw = CONFIG_PATH.read_bytes()
+            data = orjson.loads(raw) if orjson else json.loads(raw)
+            # JSON object keys are always strings; only values need checking
+            if not isinstance(data, dict) or any(
+                not isinstance(v, str) for v in data.values()
+            ):
+                raise ValueError("expected an object of phrase: path strings")
+            _CFG_CACHE = (CONFIG_PATH, gen, data)
+            return dict(data)
         except Exception:
             print(
                 f"[warn] Failed to parse {CONFIG_PATH}. "
@@ -27,50 +99,171 @@ def load_config() -> Dict[str, str]:
 
 
 def save_config(aliases: Dict[str, str]) -> None:
-    CONFIG_PATH.write_text(
-        json.dumps(aliases, indent=2, ensure_ascii=False), encoding="utf-8"
+    global _CFG_CACHE
+    if orjson is not None:
+        raw = orjson.dumps(aliases, option=orjson.OPT_INDENT_2)
+    else:
+        raw = json.dumps(aliases, indent=2, ensure_ascii=False).encode("utf-8")
+    # write a sibling temp file and rename it into place, so the voice
+    # listener (another process) never reads a truncated config
+    target = CONFIG_PATH.resolve()
+    fd, tmp = tempfile.mkstemp(
+        dir=target.parent, prefix=f".{target.name}.", suffix=".tmp"
     )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+        if target.exists():
+            shutil.copymode(target, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _CFG_CACHE = (CONFIG_PATH, _generation(CONFIG_PATH), dict(aliases))
 
 
 def normalize_phrase(p: str) -> str:
-    p = p.strip().lower()
-    p = re.sub(r"\b(the|a|an)\b", " ", p)
-    p = re.sub(r"\b(program|script|app)\b", " ", p)
-    p = re.sub(r"\s+", " ", p).strip()
-    return p
+    return " ".join(t for t in p.lower().split() if t not in _STOP)
+
+
+@dataclass
+class AliasIndex:
+    """
+    Phrase→script mappings together with the normalized form and
+    token set of every phrase, so each alias is normalized once
+    rather than on every lookup. ``token_to_keys`` maps each token
+    to the positions (in ``keys``) of the aliases containing it, and
+    ``sorted_keys`` holds the phrases in case-insensitive order.
+    ``max_key_len`` is the length of the longest phrase.
+    """
+    aliases: Dict[str, str] = field(default_factory=dict)
+    keys: List[str] = field(default_factory=list)
+    norms: List[str] = field(default_factory=list)
+    tokensets: List[FrozenSet[str]] = field(default_factory=list)
+    norm_to_key: Dict[str, str] = field(default_factory=dict)
+    token_to_keys: Dict[str, List[int]] = field(default_factory=dict)
+    sorted_keys: List[str] = field(default_factory=list)
+    max_key_len: int = 0
+
+    @classmethod
+    def from_aliases(cls, aliases: Dict[str, str]) -> "AliasIndex":
+        index = cls()
+        for k, v in aliases.items():
+            index.add(k, v)
+        return index
+
+    def add(self, key: str, script: str) -> None:
+        if key not in self.aliases:
+            norm = normalize_phrase(key)
+            ktokens = frozenset(norm.split())
+            for t in ktokens:
+                self.token_to_keys.setdefault(t, []).append(len(self.keys))
+            self.keys.append(key)
+            self.norms.append(norm)
+            self.tokensets.append(ktokens)
+            self.norm_to_key[norm] = key
+            bisect.insort_right(self.sorted_keys, key, key=str.lower)
+            self.max_key_len = max(self.max_key_len, len(key))
+        self.aliases[key] = script
+
+    def sync(self, aliases: Dict[str, str]) -> None:
+        """Match ``aliases``, normalizing only phrases not seen before."""
+        for key in [k for k in self.keys if k not in aliases]:
+            self.remove(key)
+        for k, v in aliases.items():
+            self.add(k, v)
+
+    def remove(self, key: str) -> None:
+        del self.aliases[key]
+        pos = bisect.bisect_left(self.sorted_keys, key.lower(), key=str.lower)
+        while self.sorted_keys[pos] != key:
+            pos += 1
+        del self.sorted_keys[pos]
+        if len(key) == self.max_key_len:
+            self.max_key_len = max(map(len, self.sorted_keys), default=0)
+        i = self.keys.index(key)
+        del self.keys[i]
+        norm = self.norms.pop(i)
+        for t in self.tokensets.pop(i):
+            self.token_to_keys[t].remove(i)
+            if not self.token_to_keys[t]:
+                del self.token_to_keys[t]
+        # positions after the removed alias shift down by one
+        for postings in self.token_to_keys.values():
+            postings[:] = [j - 1 if j > i else j for j in postings]
+        if self.norm_to_key.get(norm) == key:
+            del self.norm_to_key[norm]
+            # another alias may normalize the same way; the latest one wins
+            for k, norm_k in zip(reversed(self.keys), reversed(self.norms)):
+                if norm_k == norm:
+                    self.norm_to_key[norm] = k
+                    break
+
+
+def load_index() -> AliasIndex:
+    return AliasIndex.from_aliases(load_config())
 
 
 def best_match(
-    aliases: Dict[str, str],
+    index: AliasIndex,
     raw_phrase: str
 ) -> Optional[Tuple[str, str]]:
-    if not aliases:
+    if not index.aliases:
         return None
-    norm_to_key = {normalize_phrase(k): k for k in aliases.keys()}
     norm_raw = normalize_phrase(raw_phrase)
 
-    if norm_raw in norm_to_key:
-        key = norm_to_key[norm_raw]
-        return key, aliases[key]
+    if norm_raw in index.norm_to_key:
+        key = index.norm_to_key[norm_raw]
+        return key, index.aliases[key]
+
+    # only aliases sharing at least one token with the phrase, with the
+    # number of shared tokens counted straight off the postings lists
+    overlaps: Dict[int, int] = {}
+    for t in frozenset(norm_raw.split()):
+        for i in index.token_to_keys.get(t, ()):
+            overlaps[i] = overlaps.get(i, 0) + 1
+    shared = sorted(overlaps)
+
+    if process is not None and shared:
+        # norms are already normalized, so skip rapidfuzz's own processor
+        hits = process.extract(
+            norm_raw, [index.norms[i] for i in shared],
+            scorer=fuzz.token_set_ratio, processor=None,
+            score_cutoff=MATCH_CUTOFF, limit=None
+        )
+        if hits:
+            # token_set_ratio ties every alias containing the phrase's
+            # tokens, so the score only narrows the overlap ranking below
+            top = max(score for _, score, _ in hits)
+            shared = sorted(shared[j] for _, score, j in hits if score == top)
 
-    tokens = set(norm_raw.split())
     candidates: List[Tuple[int, int, str]] = []
 
-    for k in aliases.keys():
-        norm_k = normalize_phrase(k)
-        ktokens = set(norm_k.split())
-        overlap = len(tokens & ktokens)
-        if overlap > 0:
-            candidates.append((overlap, len(norm_k), k))
+    for i in shared:
+        candidates.append((overlaps[i], len(index.norms[i]), index.keys[i]))
 
     if candidates:
         candidates.sort(key=lambda t: (t[0], -t[1]), reverse=True)
         key = candidates[0][2]
-        return key, aliases[key]
+        return key, index.aliases[key]
 
-    for k in aliases.keys():
-        if normalize_phrase(k) in norm_raw or norm_raw in normalize_phrase(k):
-            return k, aliases[k]
+    for k, norm_k in zip(index.keys, index.norms):
+        if norm_k in norm_raw or norm_raw in norm_k:
+            return k, index.aliases[k]
+
+    if process is not None:
+        hits = process.extract(
+            norm_raw, index.norms, scorer=fuzz.token_set_ratio,
+            processor=None, score_cutoff=NO_SHARED_CUTOFF, limit=None
+        )
+        if hits:
+            top = max(score for _, score, _ in hits)
+            best = min(
+                (j for _, score, j in hits if score == top),
+                key=lambda j: len(index.norms[j])
+            )
+            key = index.keys[best]
+            return key, index.aliases[key]
 
     return None
 
@@ -89,44 +282,138 @@ def ensure_python_script(path: str) -> str:
     return str(p)
 
 
-def _stream_output(proc: Popen, label: str) -> None:
+def _pump_output(
+    proc: Popen,
+    label: str,
+    timeout: Optional[float] = None
+) -> None:
+    """
+    Forward the child's output line by line until it exits, raising
+    ``TimeoutExpired`` if that takes longer than ``timeout`` seconds.
+
+    The pipe is watched with a selector instead of a reader thread;
+    on Linux a pidfd is registered too, so the loop wakes as soon as
+    the child exits even if a grandchild still holds the pipe open.
+    (On Windows the pipe is read until EOF and ``timeout`` is ignored.)
+    """
     assert proc.stdout is not None
-    for line in iter(proc.stdout.readline, ""):
-        if not line:
-            break
-        print(f"[{label} {proc.pid}] {line.rstrip()}")
-    proc.stdout.close()
+    fd = proc.stdout.fileno()
+    prefix = f"[{label} {proc.pid}] "
+    # decode like text=True would, translating \r and \r\n to \n even
+    # when they straddle two reads
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(locale.getpreferredencoding(False))(
+            errors="replace"
+        ),
+        translate=True
+    )
+    pending = ""
+
+    def forward(chunk: bytes, final: bool = False) -> str:
+        *lines, rest = (pending + decoder.decode(chunk, final)).split("\n")
+        for line in lines:
+            print(prefix + line.rstrip())
+        return rest
+
+    try:
+        if os.name == "nt":
+            # select() only handles sockets on Windows; block on the pipe
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                pending = forward(chunk)
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+        pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(proc.pid)
+                sel.register(pidfd, selectors.EVENT_READ)
+            except OSError:
+                pidfd = None
+        # without a pidfd, fall back to polling for the exit
+        poll_every = None if pidfd is not None else 0.1
+        try:
+            eof = exited = False
+            while not (eof or exited):
+                wait = poll_every
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutExpired(proc.args, timeout)
+                    wait = remaining if wait is None else min(wait, remaining)
+                for key, _ in sel.select(wait):
+                    if key.fd == fd:
+                        chunk = os.read(fd, 65536)
+                        if chunk:
+                            pending = forward(chunk)
+                        else:
+                            eof = True
+                    else:
+                        exited = True
+                if pidfd is None and proc.poll() is not None:
+                    exited = True
+            if exited and not eof:
+                # child is gone: forward what is already buffered, but
+                # don't wait for anything still holding the pipe
+                if pidfd is not None:
+                    sel.unregister(pidfd)
+                while sel.select(0):
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    pending = forward(chunk)
+        finally:
+            sel.close()
+            if pidfd is not None:
+                os.close(pidfd)
+    finally:
+        pending = forward(b"", final=True)
+        if pending:
+            print(prefix + pending.rstrip())
+
+
+@lru_cache(maxsize=128)
+def _script_location(script_path: str) -> Tuple[str, str]:
+    p = Path(script_path)
+    return str(p.resolve().parent), p.name
 
 
 def run_script(script_path: str, attach: bool = True) -> int:
     py_exe = sys.executable
     cmd = [py_exe, script_path]
-    cwd = str(Path(script_path).resolve().parent)
+    cwd, name = _script_location(script_path)
 
+    # Popen rather than os.posix_spawn: posix_spawn has no chdir file
+    # action, and since CPython 3.10 Popen already launches via vfork()
+    # with these arguments, so the parent's page tables aren't copied.
     if attach:
-        proc = Popen(cmd, cwd=cwd, stdout=PIPE, stderr=STDOUT, text=True)
-        t = threading.Thread(target=_stream_output, args=(proc, Path(script_path).name), daemon=True)
-        t.start()
+        proc = Popen(cmd, cwd=cwd, stdout=PIPE, stderr=STDOUT)
+        assert proc.stdout is not None
         try:
+            _pump_output(proc, name)
             return_code = proc.wait()
-            t.join(timeout=0.5)
             if return_code == 0:
-                print(
-                    f"[ok] {Path(script_path).name} finished with exit code 0."
-                )
+                print(f"[ok] {name} finished with exit code 0.")
             else:
-                print(
-                    f"[err] {Path(script_path).name} exited with code {return_code}."
-                )
+                print(f"[err] {name} exited with code {return_code}.")
             return return_code
         except KeyboardInterrupt:
             try:
                 proc.send_signal(signal.SIGINT)
                 print("[info] Sent SIGINT to child process...")
-                return proc.wait(timeout=5)
+                # keep forwarding (and draining) output while it cleans up
+                deadline = time.monotonic() + 5
+                _pump_output(proc, name, timeout=5)
+                return proc.wait(timeout=max(0, deadline - time.monotonic()))
             except Exception:
                 proc.kill()
                 return proc.wait()
+        finally:
+            proc.stdout.close()
     else:
         kwargs = {}
         if os.name == "nt":
@@ -141,11 +428,11 @@ def run_script(script_path: str, attach: bool = True) -> int:
                 cmd, cwd=cwd, stdout=PIPE, stderr=STDOUT,
                 text=True, start_new_session=True, **kwargs
             )
-        print(f"[bg] Started {Path(script_path).name} in background (pid={proc.pid}).")
+        print(f"[bg] Started {name} in background (pid={proc.pid}).")
         return proc.pid
 
 
-def interactive_map(aliases: Dict[str, str]) -> None:
+def interactive_map(index: AliasIndex) -> None:
     phrase = input("Phrase (e.g., Scrape Program): ").strip()
     path = input("Full path to script (e.g., ~/scripts/scrape.py): ").strip()
     if not phrase or not path:
@@ -156,14 +443,14 @@ def interactive_map(aliases: Dict[str, str]) -> None:
     except Exception as e:
         print(f"[err] {e}")
         return
-    aliases[phrase] = real
-    save_config(aliases)
+    index.add(phrase, real)
+    save_config(index.aliases)
     print(f"[ok] Mapped '{phrase}' → {real}")
 
 
-def handle_map(args: List[str], aliases: Dict[str, str]) -> None:
+def handle_map(args: List[str], index: AliasIndex) -> None:
     if not args:
-        interactive_map(aliases)
+        interactive_map(index)
         return
     if len(args) < 2:
         print("[err] Usage: map \"<phrase>\" <path>")
@@ -175,54 +462,63 @@ def handle_map(args: List[str], aliases: Dict[str, str]) -> None:
     except Exception as e:
         print(f"[err] {e}")
         return
-    aliases[phrase] = real
-    save_config(aliases)
+    index.add(phrase, real)
+    save_config(index.aliases)
     print(f"[ok] Mapped '{phrase}' → {real}")
 
 
-def handle_unmap(args: List[str], aliases: Dict[str, str]) -> None:
+def handle_unmap(args: List[str], index: AliasIndex) -> None:
     if not args:
         print("[err] Usage: unmap \"<phrase>\"")
         return
     phrase = args[0]
-    if phrase in aliases:
-        del aliases[phrase]
-        save_config(aliases)
+    if phrase in index.aliases:
+        index.remove(phrase)
+        save_config(index.aliases)
         print(f"[ok] Removed mapping '{phrase}'")
         return
-    bm = best_match(aliases, phrase)
+    bm = best_match(index, phrase)
     if bm:
         key, _ = bm
-        del aliases[key]
-        save_config(aliases)
+        index.remove(key)
+        save_config(index.aliases)
         print(f"[ok] Removed mapping '{key}'")
     else:
         print(f"[warn] No mapping found for '{phrase}'")
 
 
-def handle_list(aliases: Dict[str, str]) -> None:
+def handle_list(index: AliasIndex) -> None:
+    aliases = index.aliases
     if not aliases:
         print("(no mappings yet) Use: map \"<phrase>\" <path>")
         return
-    widest = max(len(k) for k in aliases.keys())
-    for k, v in sorted(aliases.items(), key=lambda kv: kv[0].lower()):
-        print(f"{k.ljust(widest)}  ->  {v}")
+    widest = index.max_key_len
+    lines = [f"{k.ljust(widest)}  ->  {aliases[k]}" for k in index.sorted_keys]
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def parse_run_command(user_input: str) -> Tuple[str, bool]:
     bg = user_input.strip().endswith("&")
     s = user_input.strip().removesuffix("&").strip()
-    m = re.match(r"^run\s+(.*)$", s, flags=re.I)
+    m = _RUN_RE.match(s)
     phrase = m.group(1) if m else s
     return phrase.strip().strip("\"'"), bg
 
 
-def handle_run(rest: str, aliases: Dict[str, str]) -> None:
+def handle_run(
+    rest: str,
+    index: AliasIndex,
+    match: Optional[Tuple[str, str]] = None
+) -> None:
+    """
+    Run the script mapped to the phrase in ``rest``. ``match`` may carry
+    a ``best_match`` result already computed for that phrase.
+    """
     phrase, bg = parse_run_command(rest)
     if not phrase:
         print("[err] Nothing to run. Try: run <phrase>")
         return
-    bm = best_match(aliases, phrase)
+    bm = match or best_match(index, phrase)
     if not bm:
         print(
             f"[warn] No mapping matched '{phrase}'. "
@@ -1,9 +1,42 @@
-import queue
+import multiprocessing
 import re
+import signal
 import threading
-from typing import Dict, Optional
+from collections import deque
+from typing import Optional, Tuple
 
-from runner import handle_run
+from runner import (AliasIndex, ConfigGeneration, best_match,
+                    config_generation, handle_run, load_config, load_index)
+
+# trailing words that ask for a background run ("run backup and")
+_BG_WORDS = frozenset({"and", "ampersand", "background"})
+
+# Vosk results are one-key JSON objects ({"text" : "..."}); pulling the
+# string out directly is cheaper than a full json.loads per utterance
+_TEXT_RE = re.compile(r'"text"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"')
+_PARTIAL_RE = re.compile(r'"partial"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"')
+
+# samples per audio block (0.5 s at 16 kHz); partial results can only
+# change once per block
+BLOCKSIZE = 8000
+
+# audio blocks kept while the recognizer catches up; older blocks are
+# dropped once it falls further behind
+AUDIO_BACKLOG = 64
+
+# audio blocks a partial "run ..." transcript must survive unchanged
+# before its phrase is matched ahead of the final result; over one
+# block, so the timer spans at least one more partial
+PARTIAL_SETTLE_BLOCKS = 1.5
+
+# seconds between checks that the REPL process is still alive
+PARENT_CHECK = 1.0
+
+# (phrase, best_match result, config generation it was matched against)
+Speculation = Tuple[
+    Optional[str], Optional[Tuple[str, str]], Optional[ConfigGeneration]
+]
+_NO_SPECULATION: Speculation = (None, None, None)
 
 
 def have_vosk() -> bool:
@@ -24,14 +57,14 @@ def list_audio_devices() -> None:
 
 
 def start_voice_listener(
-    aliases: Dict[str, str],
+    index: AliasIndex,
     model_dir: Optional[str],
     device: Optional[int],
     sample_rate: int = 16000
-) -> threading.Thread:
+) -> multiprocessing.Process:
     """
-    Start a background thread that listens on the microphone
-    and triggers runs on phrases like:
+    Start a subprocess that listens on the microphone, plus a thread
+    that triggers runs on the phrases it hears, like:
     "run scrape program" or "run the backup script &"
     """
     if not have_vosk():
@@ -41,11 +74,6 @@ def start_voice_listener(
         )
         return None  # type: ignore
 
-    import json as _json
-
-    import sounddevice as sd
-    from vosk import KaldiRecognizer, Model
-
     # Load model
     if model_dir is None:
         print(
@@ -55,83 +83,194 @@ def start_voice_listener(
         print("      Voice mode will not start.")
         return None  # type: ignore
 
+    out_q: "multiprocessing.Queue" = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=_voice_worker,
+        args=(model_dir, device, sample_rate, out_q),
+        daemon=True
+    )
+    proc.start()
+
+    def consumer():
+        for text, speculated in iter(out_q.get, None):
+            try:
+                _maybe_run_from_voice(text, index, speculated)
+            except Exception as e:
+                print(f"[voice err] {e}")
+
+    threading.Thread(target=consumer, daemon=True).start()
+    return proc
+
+
+def _voice_worker(
+    model_dir: str,
+    device: Optional[int],
+    sample_rate: int,
+    out_q: "multiprocessing.Queue"
+) -> None:
+    """
+    Subprocess body: run the microphone + Vosk loop and put
+    ``(text, speculated)`` on ``out_q`` for every transcript holding a
+    "run ..." command. ``None`` is put when the loop ends.
+    """
+    # Ctrl+C belongs to the REPL (and the scripts it runs)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import sounddevice as sd
+    from vosk import KaldiRecognizer, Model
+
     try:
         model = Model(model_dir)
     except Exception as e:
         print(f"[err] Could not load Vosk model at '{model_dir}': {e}")
-        return None  # type: ignore
+        out_q.put(None)
+        return
 
-    q = queue.Queue()
+    # deque.append/popleft are atomic, so the callback only has to copy
+    # the block (its buffer is reused by PortAudio) and wake the loop
+    blocks = deque(maxlen=AUDIO_BACKLOG)
+    ready = threading.Event()
 
     def audio_callback(indata, frames, time_, status):
         if status:
             print(f"[audio] {status}", flush=True)
-        q.put(bytes(indata))
+        blocks.append(bytes(indata))
+        ready.set()
 
     # Create recognizer
     rec = KaldiRecognizer(model, sample_rate)
     rec.SetWords(False)
 
-    def worker():
-        print(
-            "[voice] Listening... say something like: "
-            "'run scrape program'  (Ctrl+C to stop)"
+    # Match the phrase from a settled partial transcript in the
+    # background, so the final result can dispatch without waiting
+    # on best_match.
+    index = load_index()
+    settle = PARTIAL_SETTLE_BLOCKS * BLOCKSIZE / sample_rate
+    pending: Optional[threading.Timer] = None
+    last_phrase: Optional[str] = None
+    speculated: Speculation = _NO_SPECULATION
+
+    def speculate(phrase: str) -> None:
+        nonlocal speculated
+        # pick up maps/unmaps the REPL saved; unchanged files are cached
+        aliases = load_config()
+        if aliases != index.aliases:
+            index.sync(aliases)
+        speculated = (
+            phrase, best_match(index, phrase), config_generation()
         )
-        try:
-            with sd.RawInputStream(
-                samplerate=sample_rate,
-                blocksize=8000,
-                device=device,
-                dtype='int16',
-                channels=1,
-                callback=audio_callback
-            ):
-                while True:
-                    data = q.get()
+
+    def on_partial(partial: str) -> None:
+        nonlocal pending, last_phrase
+        cmd = _parse_voice_command(partial)
+        if cmd is None or cmd[0] == last_phrase:
+            return
+        last_phrase = cmd[0]
+        if pending is not None:
+            pending.cancel()
+        pending = threading.Timer(settle, speculate, args=(cmd[0],))
+        pending.daemon = True
+        pending.start()
+
+    def on_final(text: str) -> None:
+        nonlocal pending, last_phrase, speculated
+        if pending is not None:
+            pending.cancel()
+            pending = None
+        last_phrase = None
+        if _parse_voice_command(text) is not None:
+            out_q.put((text, speculated))
+        speculated = _NO_SPECULATION
+
+    # a daemon child is only reaped by the parent's atexit hook, so stop
+    # on our own if the REPL is killed rather than keep the mic open
+    parent = multiprocessing.parent_process()
+
+    def parent_alive() -> bool:
+        return parent is None or parent.is_alive()
+
+    print(
+        "[voice] Listening... say something like: "
+        "'run scrape program'  (Ctrl+C to stop)"
+    )
+    try:
+        with sd.RawInputStream(
+            samplerate=sample_rate,
+            blocksize=BLOCKSIZE,
+            device=device,
+            dtype='int16',
+            channels=1,
+            callback=audio_callback
+        ):
+            while parent_alive():
+                ready.wait(PARENT_CHECK)
+                ready.clear()
+                while blocks:
+                    data = blocks.popleft()
                     if rec.AcceptWaveform(data):
-                        result = rec.Result()
-                        try:
-                            text = _json.loads(result).get("text", "")
-                        except Exception:
-                            text = ""
-                        _maybe_run_from_voice(text, aliases)
+                        m = _TEXT_RE.search(rec.Result())
+                        on_final(m.group(1) if m else "")
                     else:
-                        # partial = _json.loads(
-                        # rec.PartialResult()).get("partial", "")
-                        pass
-        except KeyboardInterrupt:
-            print("\n[voice] stopped.")
-        except Exception as e:
-            print(f"[voice err] {e}")
-
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-    return t
+                        m = _PARTIAL_RE.search(rec.PartialResult())
+                        on_partial(m.group(1) if m else "")
+    except Exception as e:
+        print(f"[voice err] {e}")
+    finally:
+        if parent_alive():
+            out_q.put(None)
+        else:
+            # nobody will read the queue; don't block exit flushing it
+            out_q.cancel_join_thread()
 
 
-def _maybe_run_from_voice(text: str, aliases: Dict[str, str]) -> None:
+def _parse_voice_command(text: str) -> Optional[Tuple[str, bool]]:
+    """
+    Pull ``(phrase, background)`` out of a transcript containing a
+    "run ..." segment, or return None.
+    """
     if not text:
-        return
+        return None
     # try to find a "run ..." segment
-    m = re.search(r"\brun\s+(.+)$", text)
-    if not m:
-        return
-    phrase_raw = m.group(1).strip()
+    if text.startswith("run "):
+        phrase_raw = text[4:].strip()
+    else:
+        idx = text.find(" run ")
+        if idx < 0:
+            return None
+        phrase_raw = text[idx + 5:].strip()
+    if not phrase_raw:
+        return None
     # allow saying "and" or "ampersand" / "background"
     bg = False
-    if (
-        phrase_raw.endswith("and") or
-        phrase_raw.endswith("ampersand") or
-        phrase_raw.endswith("background")
-    ):
+    head, _, last = phrase_raw.rpartition(" ")
+    if last in _BG_WORDS:
         bg = True
-        phrase_raw = \
-            re.sub(r"(and|ampersand|background)$", "", phrase_raw).strip()
+        phrase_raw = head.rstrip()
+    return phrase_raw, bg
+
+
+def _maybe_run_from_voice(
+    text: str,
+    index: AliasIndex,
+    speculated: Speculation = _NO_SPECULATION
+) -> None:
+    cmd = _parse_voice_command(text)
+    if cmd is None:
+        return
+    phrase_raw, bg = cmd
 
     # Normalize and try to run
     print(
         f"[voice] heard: '{text}' → interpreted phrase: "
-        "'{phrase_raw}'{' (bg)' if bg else ''}"
+        f"'{phrase_raw}'{' (bg)' if bg else ''}"
     )
     phrase = "run " + phrase_raw + (" &" if bg else "")
-    handle_run(phrase, aliases)
+    # the listener matched against its own copy of the config; only
+    # reuse that if both processes last saw the same version of it
+    spec_phrase, spec_match, spec_gen = speculated
+    if (
+        spec_phrase != phrase_raw or spec_gen is None or
+        spec_gen != config_generation()
+    ):
+        spec_match = None
+    handle_run(phrase, index, spec_match)